@@ -6,41 +6,33 @@ import struct
 import seaborn as sn
 import pandas as pd
 import matplotlib.pyplot as plt
+from numba import njit
+from scipy.special import expit
 
 def load_dataset():
-    sample_label_pairs = [] # [ (sample, label) ]
+    num_features = 4
+    feature_dtypes = { i: np.float32 for i in range(num_features) }
 
-    with open(f'./iris_dataset.csv', 'rb') as csv_file:
-        for row in csv_file:
-            cells = [ cell.strip() for cell in row.decode().split(',') ]
+    dataset = pd.read_csv('./iris_dataset.csv', header=None, dtype=feature_dtypes, skipinitialspace=True)
 
-            label = cells[ len(cells)-1 ]
-            sample = np.array(cells[ :len(cells)-1], dtype=np.float32)
-
-            sample_label_pairs.append( (sample, label) )
-
-    sample_label_pairs = np.array(sample_label_pairs)
-    samples, labels = np.transpose(sample_label_pairs)
+    # to_numpy does not return a C-contiguous matrix, so copy it into one
+    samples = np.ascontiguousarray(dataset.iloc[ :, :num_features ].to_numpy(dtype=np.float32)) # dim (150,4)
+    labels = dataset.iloc[ :, num_features ].to_numpy() # dim (150,)
 
     return samples, labels
 
 def split_dataset(samples, labels, split_index):
-    classes = np.unique(labels)
-
-    indices_by_class = []
-    for curr_class in classes:
-        indices = np.where(labels == curr_class)[0]
-        indices_by_class.append(indices)
-    indices_by_class = np.array(indices_by_class)
+    num_classes = len(np.unique(labels))
 
-    first_set_indices_by_class = indices_by_class[ :, :split_index ]
-    last_set_indices_by_class = indices_by_class[ :, split_index:]
+    # Sample indices grouped by class, keeping their order within each class.
+    # ASSUMES: every class has the same number of samples
+    indices_by_class = np.argsort(labels, kind='stable').reshape(num_classes, -1)
 
-    first_set_indices = first_set_indices_by_class.flatten()
-    last_set_indices = last_set_indices_by_class.flatten()
+    first_set_indices = indices_by_class[ :, :split_index ].ravel()
+    last_set_indices = indices_by_class[ :, split_index: ].ravel()
 
-    first_set = samples.take(first_set_indices), labels.take(first_set_indices)
-    last_set = samples.take(last_set_indices), labels.take(last_set_indices)
+    first_set = samples[first_set_indices], labels[first_set_indices]
+    last_set = samples[last_set_indices], labels[last_set_indices]
 
     return first_set, last_set
 
@@ -63,6 +55,17 @@ def remove_feature(samples, feature_index):
 
     return np.array(samples_without_feature)
 
+# Returns a copy of samples with an extra column of ones, i.e. the
+# "awkward 1" appended to every x_k, as a C-contiguous float32 matrix
+def add_ones_column(samples):
+    num_samples, num_features = samples.shape
+
+    samples_with_ones = np.empty((num_samples, num_features+1), dtype=np.float32)
+    samples_with_ones[ :, :num_features ] = samples
+    samples_with_ones[ :, num_features ] = 1
+
+    return samples_with_ones
+
 
 ######################################
 #      -- LINEAR CLASSIFIER --       #
@@ -71,125 +74,127 @@ def remove_feature(samples, feature_index):
 # Implements eq. (3.20) using
 # samples = x
 # Returns vectors such as [0.321 0.485 0.843]^T
-def get_predicted_label_vectors(samples, W):
-    exponentials = np.array([ np.exp(-(np.matmul(W, sample))) for sample in samples ])
-    denominators = exponentials + 1
-    predictions = 1 / denominators
+# If given, out is a preallocated buffer of dim (N, num_classes) to write to
+def get_predicted_label_vectors(samples, W, out=None):
+    # One matmul for the whole batch: dim (N, num_classes)
+    z = np.matmul(samples, np.transpose(W), out=out)
 
-    return predictions
-
-# Finds the class which is closest to a given label vector
-# i.e.: [0.321 0.485 0.843]^T returns [0 0 1]^T
-def get_rounded_label_vector(label_vector):
-    index = np.argmax(label_vector)
-    rounded_vector_label = np.array([ i == index for i in range(len(label_vector)) ], dtype=np.uint8)
+    # Sigmoid in place, without allocating new temporaries
+    predictions = expit(z, out=z)
 
-    return rounded_vector_label
+    return predictions
 
-# Implements eq. (3.22) and eq. (3.23) using
-# predicted_labels[k] = g_k
+# Implements eq. (3.20), eq. (3.22) and eq. (3.23) in a single pass using
 # labels[k] = t_k
 # samples = x
-# previous_W = W(m - 1)
-# ASSUMES: len(predicted_labels) = len(labels) = len(samples)
-def get_next_weight_matrix(predicted_labels, labels, samples, previous_W, alpha=0.01):
-    num_features = len(samples[0]) - 1 # Subtract 1 because of the 1-fill
-    num_classes = 3
-    grad_g_MSE = predicted_labels - labels # dim (30,3)
-    grad_z_g = predicted_labels * (1 - predicted_labels) # dim (30,3)
-
-    grad_W_z = np.array([ np.reshape(sample, (1, num_features+1)) for sample in samples ])
-
-    grad_W_MSE = np.sum( np.matmul(np.reshape(grad_g_MSE[k] * grad_z_g[k], (num_classes, 1)), grad_W_z[k]) for k in range(len(grad_g_MSE)) )
-
-    next_W = previous_W - alpha * grad_W_MSE
-
-    return next_W
+# W = W(m - 1), which is updated in place to W(m)
+# grad_W_MSE = preallocated buffer with the same dimension as W
+# ASSUMES: len(labels) = len(samples), and every argument is float32
+@njit(fastmath=True, cache=True)
+def train_iteration(W, samples, labels, grad_W_MSE, alpha):
+    num_samples, num_features = samples.shape # num_features includes the 1-fill
+    num_classes = W.shape[0]
+
+    # Typed constant, so that the arithmetic stays in float32
+    one = np.float32(1)
+
+    grad_W_MSE[:, :] = 0
+    for k in range(num_samples):
+        for c in range(num_classes):
+            z = np.float32(0)
+            for f in range(num_features):
+                z += W[c, f] * samples[k, f]
+            g = one / (one + np.exp(-z))
+
+            # grad_g_MSE * grad_z_g:
+            delta = (g - labels[k, c]) * g * (one - g)
+
+            # Add the outer product delta_k x_k^T:
+            for f in range(num_features):
+                grad_W_MSE[c, f] += delta * samples[k, f]
+
+    for c in range(num_classes):
+        for f in range(num_features):
+            W[c, f] -= alpha * grad_W_MSE[c, f]
 
 # This function uses train_samples and train_labels to train a  linear classifier
 # For each iteration, it outputs its error rate by comparing against
 # the test set (test_samples, test_labels)
 # It outputs the weighing matrix W and the rate of errors per iteration
 def train_linear_classifier(train_samples, train_label_vectors, test_samples, test_label_vectors, features, num_iterations=1000, alpha=0.01):
-    classes = np.unique(train_label_vectors)
-    num_classes = 3
+    num_classes = train_label_vectors.shape[1]
     num_features = len(features)
 
-    MSE_per_iteration = []
-    error_rate_per_iteration = []
+    MSE_per_iteration = np.empty(num_iterations)
+    error_rate_per_iteration = np.empty(num_iterations)
+
+    # Keep everything in float32, so no operation is upcast to float64
+    alpha = np.float32(alpha)
+
+    # Initialize weight matrix and the gradient buffer used by train_iteration
+    W = np.zeros((num_classes, num_features+1), dtype=np.float32)
+    grad_W_MSE = np.empty_like(W)
 
-    # Initialize weight matrix
-    W = np.zeros((num_classes, num_features+1))
+    # Rows of the identity matrix are the one-hot label vectors
+    identity = np.eye(num_classes, dtype=np.uint8)
+
+    # Buffers reused by every iteration when testing
+    num_test_samples = len(test_samples)
+    predicted_test_label_vectors = np.empty((num_test_samples, num_classes), dtype=np.float32)
+    predicted_test_classes = np.empty(num_test_samples, dtype=np.intp)
+    predicted_test_label_vectors_rounded = np.empty((num_test_samples, num_classes), dtype=np.uint8)
 
     for curr_iteration in range(num_iterations):
         # Training
-        predicted_train_label_vectors = get_predicted_label_vectors(train_samples, W)
-        W = get_next_weight_matrix(predicted_train_label_vectors, train_label_vectors, train_samples, W, alpha)
+        train_iteration(W, train_samples, train_label_vectors, grad_W_MSE, alpha)
 
         # Testing
-        predicted_test_label_vectors = get_predicted_label_vectors(test_samples, W)
-        predicted_test_label_vectors_rounded = np.array([ \
-            get_rounded_label_vector(label_vector) \
-            for label_vector in predicted_test_label_vectors \
-        ])
-
-        curr_MSE = get_MSE(predicted_test_label_vectors, test_label_vectors)
-        MSE_per_iteration.append(curr_MSE)
+        get_predicted_label_vectors(test_samples, W, out=predicted_test_label_vectors)
+        # Round to the closest class, i.e.: [0.321 0.485 0.843]^T becomes [0 0 1]^T
+        predicted_test_label_vectors.argmax(axis=1, out=predicted_test_classes)
+        identity.take(predicted_test_classes, axis=0, out=predicted_test_label_vectors_rounded)
 
-        curr_error_rate = get_error_rate(predicted_test_label_vectors_rounded, test_label_vectors)
-        error_rate_per_iteration.append(curr_error_rate)
+        MSE_per_iteration[curr_iteration] = get_MSE(predicted_test_label_vectors, test_label_vectors)
+        error_rate_per_iteration[curr_iteration] = get_error_rate(predicted_test_label_vectors_rounded, test_label_vectors)
 
-    return W, np.array(MSE_per_iteration), np.array(error_rate_per_iteration)
+    return W, MSE_per_iteration, error_rate_per_iteration
 
 # Implements eq. (3.19) using
 # predicted_label_vectors[k] = g_k
 # true_label_vectors[k] = t_k
 def get_MSE(predicted_label_vectors, true_label_vectors):
-    error = predicted_label_vectors - true_label_vectors
-    error_T = np.transpose(error)
-    return np.sum(np.matmul(error_T,error)) / 2
+    error = np.ravel(predicted_label_vectors - true_label_vectors)
+    return np.dot(error, error) / 2
 
 # Assumes that predicted_label_vectors are rounded
-# using get_rounded_label_vector
+# to one-hot label vectors
 def get_error_rate(predicted_label_vectors, true_label_vectors):
-    num_samples = len(true_label_vectors)
-    classes = np.unique(true_label_vectors)
-
-    num_errors = 0
-    for i in range(len(true_label_vectors)):
-        if not np.array_equal(true_label_vectors[i], predicted_label_vectors[i]):
-            num_errors += 1
+    # A sample is misclassified if any element of its label vector differs
+    is_error = np.any(predicted_label_vectors != true_label_vectors, axis=1)
 
-    return num_errors / num_samples
+    return is_error.mean()
 
 def get_confusion_matrix(predicted_label_strings, true_label_strings):
     classes = np.unique(true_label_strings)
+    num_classes = len(classes)
 
-    confusion_matrix = []
-    for predicted_class in classes:
-        row = []
+    # Map label strings to class indices (classes is sorted by np.unique):
+    predicted_indices = np.searchsorted(classes, predicted_label_strings)
+    true_indices = np.searchsorted(classes, true_label_strings)
 
-        for true_class in classes:
-            # All occurences of current true_class in true_label_strings:
-            true_indices = np.where(true_label_strings == true_class)[0]
+    # Count every (predicted_class, true_class) pair in a single pass:
+    cell_indices = predicted_indices * num_classes + true_indices
+    confusion_matrix = np.bincount(cell_indices, minlength=num_classes**2)
 
-            # All occurences of current predicted_class in predicted_label_strings:
-            predicted_indices = np.where(predicted_label_strings == predicted_class)[0]
+    return confusion_matrix.reshape(num_classes, num_classes)
 
-            # We want to find the number of elements where these two matches:
-            num_occurences = len( np.intersect1d(true_indices, predicted_indices) )
-            row.append(num_occurences)
+# Maps every label string to its one-hot label vector
+# ASSUMES: classes is sorted, as returned by np.unique
+def label_strings_to_vectors(string_labels, classes):
+    identity = np.eye(len(classes), dtype=np.float32)
+    vector_labels = identity[ np.searchsorted(classes, string_labels) ]
 
-        confusion_matrix.append(row)
-
-    return np.array(confusion_matrix)
-
-def label_string_to_vector(string_label, classes):
-    index = np.where(classes == string_label)[0]
-    vector_label = np.array([ i == index for i in range(len(classes)) ], dtype=np.uint8)
-    vector_label = np.reshape(vector_label, len(vector_label))
-
-    return vector_label
+    return vector_labels
 
 def label_vector_to_string(vector_label, classes):
     index = np.argmax(vector_label)
@@ -206,6 +211,9 @@ def plot_histograms(samples, labels, features, step_length=0.1):
     num_cols = np.uint8(np.floor(np.sqrt(num_subplots)))
     num_rows = np.uint8(np.ceil(num_subplots / num_cols))
 
+    # Group the samples by class once, instead of once per feature
+    samples_by_class = [ samples[labels == curr_class] for curr_class in classes ]
+
     fig = plt.figure(figsize=(10, 10))
 
     for feature_index in range(len(features)):
@@ -214,12 +222,8 @@ def plot_histograms(samples, labels, features, step_length=0.1):
         ax = fig.add_subplot(num_cols, num_rows, feature_index+1)
         ax.set(xlabel='Measurement [cm]', ylabel='Number of samples')
 
-        for curr_class in classes:
-            sample_indices = np.where(labels == curr_class)[0]
-
-            samples_matching_class = [ samples[i] for i in sample_indices ]
-            measurements_by_features = np.transpose(samples_matching_class)
-            measurements_matching_feature = measurements_by_features[feature_index]
+        for curr_class, samples_matching_class in zip(classes, samples_by_class):
+            measurements_matching_feature = samples_matching_class[ :, feature_index ]
 
             ax.hist(measurements_matching_feature, alpha=0.5, stacked=True, label=curr_class)
 
@@ -280,12 +284,12 @@ def show_MSE_plots(train_dataset, test_dataset, features, alphas, num_iterations
     classes = np.unique(train_labels)
 
      # We need to add an awkward 1 to x_k as described on page 15:
-    train_samples = np.array([ np.append(sample, [1]) for sample in train_samples ])
-    test_samples = np.array([ np.append(sample, [1]) for sample in test_samples ])
+    train_samples = add_ones_column(train_samples)
+    test_samples = add_ones_column(test_samples)
 
     # Get vector representation of label strings
-    train_label_vectors = np.array([ label_string_to_vector(label, classes) for label in train_labels])
-    test_label_vectors = np.array([ label_string_to_vector(label, classes) for label in test_labels])
+    train_label_vectors = label_strings_to_vectors(train_labels, classes)
+    test_label_vectors = label_strings_to_vectors(test_labels, classes)
 
     MSEs_per_alpha = []
     for alpha in alphas:
@@ -305,12 +309,12 @@ def show_error_rate_plots(train_dataset, test_dataset, features, alpha=0.005, nu
     classes = np.unique(train_labels)
 
      # We need to add an awkward 1 to x_k as described on page 15:
-    train_samples = np.array([ np.append(sample, [1]) for sample in train_samples ])
-    test_samples = np.array([ np.append(sample, [1]) for sample in test_samples ])
+    train_samples = add_ones_column(train_samples)
+    test_samples = add_ones_column(test_samples)
 
     # Get vector representation of label strings
-    train_label_vectors = np.array([ label_string_to_vector(label, classes) for label in train_labels])
-    test_label_vectors = np.array([ label_string_to_vector(label, classes) for label in test_labels])
+    train_label_vectors = label_strings_to_vectors(train_labels, classes)
+    test_label_vectors = label_strings_to_vectors(test_labels, classes)
 
 
     # Calculate error rate for TEST:
@@ -337,12 +341,12 @@ def show_confusion_matrices(train_dataset, test_dataset, features, num_iteration
     classes = np.unique(train_labels)
 
      # We need to add an awkward 1 to x_k as described on page 15:
-    train_samples = np.array([ np.append(sample, [1]) for sample in train_samples ])
-    test_samples = np.array([ np.append(sample, [1]) for sample in test_samples ])
+    train_samples = add_ones_column(train_samples)
+    test_samples = add_ones_column(test_samples)
 
     # Get vector representation of label strings
-    train_label_vectors = np.array([ label_string_to_vector(label, classes) for label in train_labels])
-    test_label_vectors = np.array([ label_string_to_vector(label, classes) for label in test_labels])
+    train_label_vectors = label_strings_to_vectors(train_labels, classes)
+    test_label_vectors = label_strings_to_vectors(test_labels, classes)
 
     # Here we use num_iterations=30 annd alpha=0.005 because these values proved to
     # give the best results, as discussed in the report
@@ -352,12 +356,15 @@ def show_confusion_matrices(train_dataset, test_dataset, features, num_iteration
         features, num_iterations, alpha \
     )
 
+    # Rows of the identity matrix are the one-hot label vectors
+    identity = np.eye(len(classes), dtype=np.uint8)
+
     predicted_test_label_vectors = get_predicted_label_vectors(test_samples, W)
-    predicted_test_label_vectors = np.array([ get_rounded_label_vector(label_vector) for label_vector in predicted_test_label_vectors ])
+    predicted_test_label_vectors = identity.take(predicted_test_label_vectors.argmax(axis=1), axis=0)
     predicted_test_label_strings = np.array([ label_vector_to_string(label, classes) for label in predicted_test_label_vectors ])
 
     predicted_train_label_vectors = get_predicted_label_vectors(train_samples, W)
-    predicted_train_label_vectors = np.array([ get_rounded_label_vector(label_vector) for label_vector in predicted_train_label_vectors ])
+    predicted_train_label_vectors = identity.take(predicted_train_label_vectors.argmax(axis=1), axis=0)
     predicted_train_label_strings = np.array([ label_vector_to_string(label, classes) for label in predicted_train_label_vectors ])
 
     confusion_matrix_test = get_confusion_matrix(predicted_test_label_strings, test_labels)
@@ -2,26 +2,12 @@ import numpy as np
 import matplotlib.pyplot as plt
 
 def load_dataset():
-    sample_label_pairs = [] # [ (data, label) ]
+    # Keep only the first two features
+    dataset = np.loadtxt('./iris_dataset.csv', delimiter=',', dtype=str, usecols=(0, 1, 4))
+    np.random.shuffle(dataset)
 
-    with open(f'./iris_dataset.csv', 'rb') as csv_file:
-        for row in csv_file:
-            cells = [ cell.strip() for cell in row.decode().split(',') ]
-
-            label = cells[ len(cells) - 1 ]
-            sample = np.array(cells[:len(cells) - 1], dtype=np.float32)
-
-            # Keep only petal length and width
-            sample = sample[:2 ]
-
-            sample_label_pairs.append( (sample, label) )
-
-    sample_label_pairs = np.array(sample_label_pairs)
-    np.random.shuffle(sample_label_pairs)
-
-    samples, labels = np.transpose(sample_label_pairs)
-    samples = np.array(samples)
-    labels = np.array(labels)
+    samples = dataset[ :, :2 ].astype(np.float32)
+    labels = dataset[ :, 2 ]
 
     return samples, labels
 
@@ -31,8 +17,8 @@ classes = np.unique(labels)
 # Plot petal length and width
 for curr_class in classes:
     indices = np.where(labels == curr_class)[0]
-    petal_lengths = [ samples[i][0] for i in indices ]
-    petal_widths = [ samples[i][1] for i in indices ]
+    petal_lengths = samples[indices, 0]
+    petal_widths = samples[indices, 1]
     plt.scatter(petal_lengths, petal_widths, label=curr_class)
 
 plt.xlabel("Sepal length [cm]")